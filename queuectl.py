@@ -5,13 +5,18 @@ import json
 import datetime as dt
 import sys
 import subprocess
+import shlex
+import selectors
 import time
+import math
 import signal
 import multiprocessing
 import uuid
+import collections
 import threading
+import queue
+import atexit
 import sqlite3
-from sqlite3 import Error
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -19,31 +24,99 @@ load_dotenv()
 
 # Get database configuration from environment variables
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///queuectl.db")
-QUEUECTL_DB = os.getenv("QUEUECTL_DB", "queuectl.db")
+QUEUECTL_DB = os.getenv("QUEUECTL_DB")  # None when unset
+
+_UTC = dt.timezone.utc
 
 DEFAULTS = {
     "max_retries": "3",
     "backoff_base": "2",
     "poll_interval": "0.5",
     "job_timeout": "120",
+    "batch_size": "1",
+    "heartbeat_interval": "0",
 }
 
 # ---------------- DB helpers ----------------
-def _connect():
-    # Extract database path from QUEUECTL_DB or DATABASE_URL
+def _db_path() -> str:
+    """Database file (or file: URI) to open: QUEUECTL_DB when set, else a
+    sqlite:/// DATABASE_URL, else queuectl.db"""
     db_path = QUEUECTL_DB
+    if db_path is None:
+        db_path = DATABASE_URL if DATABASE_URL.startswith("sqlite:///") else "queuectl.db"
     if db_path.startswith("sqlite:///"):
         db_path = db_path.replace("sqlite:///", "")
-    elif DATABASE_URL.startswith("sqlite:///"):
-        db_path = DATABASE_URL.replace("sqlite:///", "")
+    return db_path
+
+def _connect():
+    db_path = _db_path()
     
-    conn = sqlite3.connect(db_path)
+    # Autocommit mode: single statements commit on their own, multi-statement
+    # transactions are opened explicitly with BEGIN IMMEDIATE. The statement
+    # cache is sized well above the number of distinct SQL strings we issue.
+    # Threading model: each thread gets its own connection via _conn(), and
+    # within a worker all job results and heartbeats are written by the single
+    # writer thread. check_same_thread=False only lets a handle be closed or
+    # handed off from another thread; never share one across threads while a
+    # transaction is open on it.
+    # A "file:" path is an SQLite URI. file:/tmp/q.db?mode=ro serves the
+    # read-only commands (init_db leaves the schema alone); an in-memory
+    # database (file:qtest?mode=memory&cache=shared) lives only as long as
+    # this process, so it is only useful when queuectl is driven in-process.
+    try:
+        conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False,
+                               cached_statements=256, uri=db_path.startswith("file:"))
+    except sqlite3.OperationalError as e:
+        # e.g. a mode=ro URI naming a database that doesn't exist yet
+        sys.exit(f"Cannot open database {db_path}: {e}")
     conn.row_factory = sqlite3.Row  # Enable named parameters
+    # Per-connection tuning; journal_mode=WAL is persistent and set in init_db()
+    conn.executescript("""
+        PRAGMA busy_timeout=30000;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-32000;
+        PRAGMA mmap_size=268435456;
+    """)
     return conn
 
+# One cached connection per thread, reused for the whole process lifetime
+_tls = threading.local()
+
+def _conn():
+    c = getattr(_tls, 'c', None)
+    if c is None:
+        c = _tls.c = _connect()
+    return c
+
+def _close_conn():
+    c = getattr(_tls, 'c', None)
+    if c is not None:
+        _tls.c = None
+        c.close()
+
+def _drop_conn_after_fork():
+    # A forked worker must not reuse the parent's SQLite handle
+    _tls.c = None
+
+atexit.register(_close_conn)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_drop_conn_after_fork)
+
+def _is_readonly_error(e: sqlite3.Error) -> bool:
+    # sqlite_errorcode is the extended code; its low byte is the primary one
+    return (getattr(e, 'sqlite_errorcode', 0) & 0xff) == sqlite3.SQLITE_READONLY
+
 def init_db():
-    conn = _connect()
-    with conn:
+    conn = _conn()
+    try:
+        # WAL lets readers run alongside the writer; the mode sticks to the file
+        conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.OperationalError as e:
+        if not _is_readonly_error(e):
+            raise
+    conn.execute("BEGIN IMMEDIATE")
+    try:
         # Create jobs table
         conn.execute("""
         CREATE TABLE IF NOT EXISTS jobs (
@@ -52,9 +125,9 @@ def init_db():
             state TEXT NOT NULL,
             attempts INTEGER NOT NULL DEFAULT 0,
             max_retries INTEGER NOT NULL,
-            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
-            updated_at TIMESTAMP WITH TIME ZONE NOT NULL,
-            due_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            due_at INTEGER NOT NULL,
             last_error TEXT,
             output TEXT,
             priority INTEGER NOT NULL DEFAULT 0,
@@ -63,6 +136,14 @@ def init_db():
         """)
         
         conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_due ON jobs(state, due_at);")
+        # Covers only claimable jobs, already in pick order, so claiming a
+        # batch is a few range scans (one per priority) that stop at LIMIT
+        # instead of a sort
+        conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_ready
+        ON jobs(priority DESC, due_at ASC, created_at ASC)
+        WHERE state IN ('pending', 'failed');
+        """)
         
         # Create workers table
         conn.execute("""
@@ -70,9 +151,9 @@ def init_db():
             id TEXT PRIMARY KEY,
             pid INTEGER NOT NULL,
             status TEXT NOT NULL,
-            started_at TIMESTAMP WITH TIME ZONE NOT NULL,
-            heartbeat_at TIMESTAMP WITH TIME ZONE NOT NULL,
-            stopped_at TIMESTAMP WITH TIME ZONE
+            started_at INTEGER NOT NULL,
+            heartbeat_at INTEGER NOT NULL,
+            stopped_at INTEGER
         );
         """)
         
@@ -91,58 +172,102 @@ def init_db():
                 VALUES(?, ?) 
                 ON CONFLICT (key) DO NOTHING
             """, (k, v))
-    conn.close()
+        
+        _migrate(conn)
+        conn.execute("COMMIT")
+    except sqlite3.OperationalError as e:
+        conn.execute("ROLLBACK")
+        # A read-only handle (mode=ro, query_only) can't create or migrate
+        # anything; that's fine as long as the schema is already in place
+        if not _is_readonly_error(e) or not _table_exists(conn, "jobs"):
+            raise
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+def _table_exists(conn, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (name,)).fetchone() is not None
+
+# Bump when init_db() needs to rewrite data created by an older version
+SCHEMA_VERSION = 1
+
+def _migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        # Timestamps used to be stored as ISO-8601 TEXT; convert them to
+        # INTEGER Unix epoch seconds (unparseable values become "now")
+        for table, cols in (("jobs", ("created_at", "updated_at", "due_at")),
+                            ("workers", ("started_at", "heartbeat_at", "stopped_at"))):
+            for col in cols:
+                conn.execute(f"""
+                    UPDATE {table}
+                    SET {col} = COALESCE(CAST(strftime('%s', {col}) AS INTEGER),
+                                         CAST(strftime('%s', 'now') AS INTEGER))
+                    WHERE typeof({col}) = 'text'
+                """)
+    if version < SCHEMA_VERSION:
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+def now_ts() -> int:
+    # Timestamps are stored as INTEGER Unix epoch seconds
+    return int(time.time())
 
-def now_iso():
-    # Use timezone-aware datetime for UTC
+def fmt_ts(ts) -> str:
+    # Render a stored timestamp for display, e.g. 2025-11-08T15:00:00Z
+    if ts is None:
+        return "-"
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))
+
+def parse_run_at(value) -> int:
+    """Convert a job's run_at (epoch seconds or ISO-8601 string) to epoch seconds"""
+    if isinstance(value, (int, float)):
+        return int(value)
     try:
-        # Python 3.11+
-        return dt.datetime.now(dt.timezone.utc).replace(microsecond=0).isoformat().replace('+00:00', 'Z')
-    except AttributeError:
-        # Fallback for older Python versions
-        return dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+        when = dt.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        sys.exit(f"Invalid run_at: {value!r} (expected ISO-8601 or epoch seconds)")
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=_UTC)  # Naive times are taken as UTC
+    return int(when.timestamp())
 
 def get_config() -> dict:
-    conn = _connect()
+    conn = _conn()
     rows = conn.execute("SELECT key,value FROM config").fetchall()
-    conn.close()
     cfg = {**DEFAULTS, **{r["key"]: r["value"] for r in rows}}
     return cfg
 
 def set_config(key: str, value: str):
     if key not in DEFAULTS:
         sys.exit(f"Unknown config key: {key}")
-    conn = _connect()
-    with conn:
-        conn.execute(
-            "INSERT INTO config(key,value) VALUES(?,?) "
-            "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-            (key, str(value)),
-        )
-    conn.close()
+    conn = _conn()
+    conn.execute(
+        "INSERT INTO config(key,value) VALUES(?,?) "
+        "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+        (key, str(value)),
+    )
 
 # --------------- Core ops (Step 2 scope) ---------------
-def enqueue_job(job_json: str):
-    try:
-        job = json.loads(job_json)
-    except json.JSONDecodeError as e:
-        sys.exit(f"Invalid JSON: {e}")
+SQL_INSERT_JOB = """
+    INSERT INTO jobs(id,command,state,attempts,max_retries,created_at,updated_at,due_at,last_error,output,priority,picked_by)
+    VALUES(:id,:command,:state,:attempts,:max_retries,:created_at,:updated_at,:due_at,:last_error,:output,:priority,:picked_by)
+"""
 
+def _job_row(job: dict, cfg: dict, created: int, default_id: str | None = None,
+             where: str = "") -> dict:
+    """Build the jobs-table row for a parsed job spec; where (e.g. " on line 3")
+    locates the job in error messages"""
+    if not isinstance(job, dict):
+        sys.exit(f"Job must be a JSON object{where}.")
     if "command" not in job:
-        sys.exit("Job must include 'command'.")
+        sys.exit(f"Job must include 'command'{where}.")
 
-    cfg = get_config()
-    try:
-        now_ts = int(dt.datetime.now(dt.timezone.utc).timestamp())
-    except AttributeError:
-        now_ts = int(dt.datetime.utcnow().timestamp())
-    job_id = job.get("id") or f"job-{now_ts}"
-    created = now_iso()
-    due_at = job.get("run_at") or created
+    job_id = job.get("id") or default_id or f"job-{created}"
+    due_at = parse_run_at(job["run_at"]) if job.get("run_at") else created
     max_retries = int(job.get("max_retries", cfg["max_retries"]))
     priority = int(job.get("priority", 0))
 
-    row = {
+    return {
         "id": job_id,
         "command": job["command"],
         "state": "pending",
@@ -157,245 +282,535 @@ def enqueue_job(job_json: str):
         "picked_by": None,
     }
 
-    conn = _connect()
+def enqueue_job(job_json: str):
+    try:
+        job = json.loads(job_json)
+    except json.JSONDecodeError as e:
+        sys.exit(f"Invalid JSON: {e}")
+
+    row = _job_row(job, get_config(), now_ts())
+    job_id = row["id"]
+
+    conn = _conn()
     try:
-        with conn:
-            conn.execute("""
-            INSERT INTO jobs(id,command,state,attempts,max_retries,created_at,updated_at,due_at,last_error,output,priority,picked_by)
-            VALUES(:id,:command,:state,:attempts,:max_retries,:created_at,:updated_at,:due_at,:last_error,:output,:priority,:picked_by)
-            """, row)
+        conn.execute(SQL_INSERT_JOB, row)
     except sqlite3.IntegrityError:
         sys.exit(f"Job with id '{job_id}' already exists.")
-    finally:
-        conn.close()
 
     print(f"Enqueued job {job_id}")
 
+def enqueue_batch(path: str, jobs_json: str | None = None):
+    """Enqueue many jobs in one transaction, from a JSON array or from
+    newline-delimited JSON in a file ('-' = stdin)"""
+    # Collect (position, job) pairs; position numbers auto-generated ids
+    # and, as where, locates the job in error messages
+    jobs = []
+    where = " (entry {})"
+    if jobs_json is not None:
+        try:
+            parsed = json.loads(jobs_json)
+        except json.JSONDecodeError as e:
+            sys.exit(f"Invalid JSON: {e}")
+        if not isinstance(parsed, list):
+            sys.exit("Expected a JSON array of jobs.")
+        jobs = list(enumerate(parsed, 1))
+    else:
+        if path == "-":
+            lines = sys.stdin.read().splitlines()
+        else:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    lines = f.read().splitlines()
+            except OSError as e:
+                sys.exit(f"Cannot read {path}: {e.strerror}")
+        where = " on line {}"
+
+        for lineno, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                jobs.append((lineno, json.loads(line)))
+            except json.JSONDecodeError as e:
+                sys.exit(f"Invalid JSON on line {lineno}: {e}")
+
+    cfg = get_config()
+    created = now_ts()
+    rows = [_job_row(job, cfg, created, default_id=f"job-{created}-{n}", where=where.format(n))
+            for n, job in jobs]
+
+    if not rows:
+        sys.exit("No jobs to enqueue.")
+
+    # All or nothing: a duplicate id rejects the whole batch
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(SQL_INSERT_JOB, rows)
+        conn.execute("COMMIT")
+    except sqlite3.IntegrityError:
+        conn.execute("ROLLBACK")
+        sys.exit("Batch contains a job id that already exists; nothing was enqueued.")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+    print(f"Enqueued {len(rows)} jobs")
+
 def list_jobs(state: str | None):
-    conn = _connect()
+    conn = _conn()
     q = "SELECT id, state, attempts, max_retries, due_at, command FROM jobs"
-    rows = conn.execute(q + (" WHERE state=?" if state else ""), (state,) if state else ()).fetchall()
-    conn.close()
+    cur = conn.execute(q + (" WHERE state=?" if state else ""), (state,) if state else ())
+    # Format straight off the cursor and emit everything in one write
+    lines = [
+        f"{r['id']:<24} {r['state']:<10} attempts={r['attempts']}/{r['max_retries']} due={fmt_ts(r['due_at'])} cmd={r['command']}"
+        for r in cur
+    ]
 
-    if not rows:
+    if not lines:
         print("(no jobs)")
         return
-    for r in rows:
-        print(f"{r['id']:<24} {r['state']:<10} attempts={r['attempts']}/{r['max_retries']} due={r['due_at']} cmd={r['command']}")
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def inspect_job(job_id: str):
+    """Print one job as JSON"""
+    row = _conn().execute("""
+        SELECT id, command, state, attempts, max_retries, priority,
+               created_at, updated_at, due_at, last_error, picked_by
+        FROM jobs WHERE id = ?
+    """, (job_id,)).fetchone()
+    if not row:
+        sys.exit(f"Job '{job_id}' not found")
+    job = dict(row)
+    for key in ("created_at", "updated_at", "due_at"):
+        job[key] = fmt_ts(job[key])
+    print(json.dumps(job))
 
 def status_summary():
-    conn = _connect()
+    conn = _conn()
     counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
-    workers = conn.execute("SELECT id,pid,status,heartbeat_at FROM workers WHERE status!='stopped'").fetchall()
-    conn.close()
+    workers = conn.execute("SELECT id,pid,status,heartbeat_at FROM workers WHERE status!='stopped'")
 
-    print("Jobs:")
+    lines = ["Jobs:"]
     total = 0
     for st in ["pending","processing","completed","failed","dead"]:
         c = counts.get(st, 0)
         total += c
-        print(f"  {st:<10}: {c}")
-    print(f"  total     : {total}")
+        lines.append(f"  {st:<10}: {c}")
+    lines.append(f"  total     : {total}")
 
-    print("\nWorkers:")
-    if not workers:
-        print("  (none running)")
-    else:
-        for w in workers:
-            print(f"  {w['id']} pid={w['pid']} status={w['status']} hb={w['heartbeat_at']}")
+    lines.append("\nWorkers:")
+    worker_lines = [
+        f"  {w['id']} pid={w['pid']} status={w['status']} hb={fmt_ts(w['heartbeat_at'])}"
+        for w in workers
+    ]
+    lines.extend(worker_lines or ["  (none running)"])
+    sys.stdout.write("\n".join(lines) + "\n")
 
 # ---------------- Worker & Job Processing ---------------- 
+# Hot-path statements live at module level so every call hands sqlite3 the
+# same string and hits its per-connection prepared-statement cache
+# Selecting and claiming happen in one statement, so the claim is atomic
+# without an explicit transaction.
+# Neither plain plan holds up: walking idx_jobs_ready in priority order
+# can't stop at due_at, so future-dated high-priority jobs are scanned on
+# every claim, and filtering on due_at first sorts the whole due backlog.
+# Instead the prio CTE steps through the distinct priorities, highest first,
+# one index seek each, and for each priority idx_jobs_ready yields its due
+# jobs in (due_at, created_at) order. CROSS JOIN fixes prio as the outer
+# loop, so rows come out in queue order and LIMIT stops at the first n; an
+# ORDER BY here would bring back the sort. Cost grows with the number of
+# distinct priorities, not with the number of jobs.
+SQL_PICK = """
+    UPDATE jobs
+    SET state = 'processing',
+        picked_by = ?,
+        updated_at = ?
+    WHERE id IN (
+        WITH RECURSIVE prio(p) AS (
+            SELECT (SELECT priority FROM jobs INDEXED BY idx_jobs_ready
+                    WHERE state IN ('pending', 'failed')
+                    ORDER BY priority DESC LIMIT 1)
+            UNION ALL
+            SELECT (SELECT priority FROM jobs INDEXED BY idx_jobs_ready
+                    WHERE state IN ('pending', 'failed') AND priority < p
+                    ORDER BY priority DESC LIMIT 1)
+            FROM prio
+            WHERE p IS NOT NULL
+        )
+        SELECT j.id
+        FROM prio CROSS JOIN jobs AS j INDEXED BY idx_jobs_ready
+        WHERE j.state IN ('pending', 'failed')
+          AND j.priority = prio.p
+          AND j.due_at <= ?
+        LIMIT ?
+    )
+    RETURNING id, command, attempts, max_retries, state, last_error,
+              priority, due_at, created_at
+"""
+
+SQL_NEXT_DUE = """
+    SELECT MIN(due_at) FROM jobs WHERE state IN ('pending', 'failed')
+"""
+
+# {placeholders} is one '?' per worker id
+SQL_HEARTBEAT = """
+    UPDATE workers
+    SET heartbeat_at = ?
+    WHERE id IN ({placeholders})
+"""
+
+SQL_DONE = """
+    UPDATE jobs
+    SET state = 'completed',
+        attempts = attempts + 1,
+        updated_at = ?,
+        output = ?,
+        last_error = NULL,
+        picked_by = NULL
+    WHERE id = ?
+"""
+
+SQL_RETRY = """
+    UPDATE jobs
+    SET state = 'failed',
+        attempts = ?,
+        updated_at = ?,
+        due_at = ?,
+        last_error = ?,
+        picked_by = NULL
+    WHERE id = ?
+"""
+
+SQL_DEAD = """
+    UPDATE jobs
+    SET state = 'dead',
+        attempts = ?,
+        updated_at = ?,
+        last_error = ?,
+        picked_by = NULL
+    WHERE id = ?
+"""
+
+_WRITE_SQL = {'done': SQL_DONE, 'retry': SQL_RETRY, 'dead': SQL_DEAD}
+
+# Job results are queued here as (kind, params) and committed by writer_loop,
+# as are ('hb', worker_id) heartbeats; a None entry tells the writer to flush
+# and exit
+_writes = queue.Queue()
+
+# A batch that fails to commit (say the database stayed locked past
+# busy_timeout) is kept and retried, backing off between attempts
+WRITE_RETRY_DELAY = 0.1
+WRITE_RETRY_MAX_DELAY = 5.0
+# Once shutting down, give up on a batch after this many more failures
+WRITE_RETRIES_ON_EXIT = 5
+
+# Set by writer_loop when it exits with every queued result committed
+_writes_flushed = threading.Event()
+
 def calculate_backoff_delay(attempts: int, base: float) -> float:
     """Calculate exponential backoff delay: base^attempts seconds"""
     return base ** attempts
 
-def pick_next_job(worker_id: str) -> dict | None:
-    """Atomically pick the next available job for processing"""
-    conn = _connect()
+def pick_next_jobs(worker_id: str, n: int) -> tuple[list[dict], float | None]:
+    """Atomically claim up to n due jobs for processing, in queue order.
+    Also returns the seconds until the earliest queued job is due (0 if one
+    already is, None if the queue is empty), for an idle worker's wait."""
+    now = now_ts()
+    # Idle polls are the common case; settle them with a cheap read instead
+    # of an UPDATE, which would take the write lock even if it claims nothing
+    due = _conn().execute(SQL_NEXT_DUE).fetchone()[0]
+    if due is None:
+        return [], None
+    if due > now:
+        return [], due - time.time()
+    rows = _conn().execute(SQL_PICK, (worker_id, now, now, n)).fetchall()
+    
+    # RETURNING order is unspecified; restore the queue order
+    jobs = sorted((dict(r) for r in rows),
+                  key=lambda j: (-j['priority'], j['due_at'], j['created_at']))
+    return jobs, 0.0
+
+def release_jobs(worker_id: str, job_ids: list[str]):
+    """Hand claimed-but-unstarted jobs back to the queue"""
+    if not job_ids:
+        return
+    placeholders = ','.join('?' * len(job_ids))
+    _conn().execute(f"""
+        UPDATE jobs
+        SET state = CASE WHEN attempts > 0 THEN 'failed' ELSE 'pending' END,
+            picked_by = NULL,
+            updated_at = ?
+        WHERE id IN ({placeholders}) AND state = 'processing' AND picked_by = ?
+    """, (now_ts(), *job_ids, worker_id))
+
+# Anything here needs /bin/sh: pipes, redirection, expansion, globbing, ...
+_SHELL_METACHARS = frozenset('|&;<>()$`\\*?[]#~\n')
+
+def _job_argv(command: str) -> list[str] | None:
+    """Split a plain command into argv, or None if it needs a shell"""
+    if os.name == 'nt' or any(c in _SHELL_METACHARS for c in command):
+        return None
     try:
-        # Use a transaction to atomically pick a job
-        with conn:
-            # Find the oldest pending or failed job that's due
-            now = now_iso()
-            job = conn.execute("""
-                SELECT id, command, attempts, max_retries, state
-                FROM jobs
-                WHERE state IN ('pending', 'failed')
-                  AND due_at <= ?
-                ORDER BY priority DESC, due_at ASC, created_at ASC
-                LIMIT 1
-            """, (now,)).fetchone()
-            
-            if not job:
-                return None
-            
-            # Atomically claim the job
-            result = conn.execute("""
-                UPDATE jobs
-                SET state = 'processing',
-                    picked_by = ?,
-                    updated_at = ?
-                WHERE id = ? AND state IN ('pending', 'failed')
-                RETURNING id, command, attempts, max_retries, state, last_error
-            """, (worker_id, now, job['id'])).fetchone()
-            
-            if result:
-                return dict(result)
-            return None
+        return shlex.split(command) or None
+    except ValueError:
+        return None  # Unbalanced quotes; let the shell report it
+
+# Bytes of stdout/stderr kept per job; only the tail of each stream survives
+OUTPUT_LIMIT = 10000
+
+def _run_captured(args, shell: bool, timeout: int) -> tuple[int, str]:
+    """Run a command and return (returncode, output): the tails of stdout
+    and stderr, together at most OUTPUT_LIMIT bytes. Each stream is trimmed
+    to its last OUTPUT_LIMIT bytes while it is being read."""
+    proc = subprocess.Popen(args, shell=shell, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, bufsize=0)
+    tails = {proc.stdout: bytearray(), proc.stderr: bytearray()}
+    try:
+        if os.name == 'nt':
+            # selectors cannot wait on pipes on Windows
+            out, err = proc.communicate(timeout=timeout)
+            tails[proc.stdout] += out[-OUTPUT_LIMIT:]
+            tails[proc.stderr] += err[-OUTPUT_LIMIT:]
+        else:
+            deadline = time.monotonic() + timeout
+            with selectors.DefaultSelector() as sel:
+                for stream in tails:
+                    sel.register(stream, selectors.EVENT_READ)
+                while sel.get_map():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise subprocess.TimeoutExpired(args, timeout)
+                    for key, _ in sel.select(remaining):
+                        chunk = os.read(key.fd, 65536)
+                        if not chunk:
+                            sel.unregister(key.fileobj)
+                            continue
+                        tail = tails[key.fileobj]
+                        tail += chunk
+                        del tail[:-OUTPUT_LIMIT]
+            proc.wait(timeout=max(0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
     finally:
-        conn.close()
+        proc.stdout.close()
+        proc.stderr.close()
+    # Share OUTPUT_LIMIT between the streams, so a chatty stdout can't push
+    # stderr out: a stream shorter than half keeps all of it and leaves the
+    # rest to the other
+    out, err = tails[proc.stdout], tails[proc.stderr]
+    err = err[max(0, len(err) - max(OUTPUT_LIMIT - len(out), OUTPUT_LIMIT // 2)):]
+    out = out[max(0, len(out) - (OUTPUT_LIMIT - len(err))):]
+    output = (out + err).decode('utf-8', errors='replace')
+    return proc.returncode, output
 
 def execute_job(job: dict, timeout: int) -> tuple[bool, str, str]:
     """Execute a job command and return (success, output, error)"""
+    argv = _job_argv(job['command'])
     try:
-        proc = subprocess.run(
-            job['command'],
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            cwd=os.getcwd()
-        )
-        output = proc.stdout + proc.stderr
-        success = proc.returncode == 0
-        error = None if success else f"Command failed with exit code {proc.returncode}"
+        result = None
+        if argv is not None:
+            # Exec the program directly, skipping the intermediate shell
+            try:
+                result = _run_captured(argv, False, timeout)
+            except OSError:
+                pass  # Shell builtin (exit, cd, ...) or missing program
+        if result is None:
+            result = _run_captured(job['command'], True, timeout)
+        returncode, output = result
+        success = returncode == 0
+        error = None if success else f"Command failed with exit code {returncode}"
         return success, output, error
     except subprocess.TimeoutExpired:
         return False, "", f"Job timed out after {timeout} seconds"
     except Exception as e:
         return False, "", str(e)
 
-def process_job(worker_id: str, shutdown_event: threading.Event):
-    """Main worker loop: pick and process jobs"""
-    cfg = get_config()
+def process_job(worker_id: str, shutdown_event: threading.Event, cfg: dict):
+    """Main worker loop: pick and process jobs until shutdown_event is set
+    (a threading.Event or a multiprocessing.Event)"""
     poll_interval = float(cfg["poll_interval"])
     timeout = int(cfg["job_timeout"])
     backoff_base = float(cfg["backoff_base"])
+    batch_size = max(1, int(cfg["batch_size"]))
     
-    while not shutdown_event.is_set():
-        job = pick_next_job(worker_id)
-        
-        if not job:
-            # No jobs available, wait and check again
-            time.sleep(poll_interval)
-            continue
-        
-        job_id = job['id']
-        attempts = job['attempts']
-        max_retries = job['max_retries']
+    # Jobs claimed in one batch wait here until this worker gets to them
+    buffer = collections.deque()
+    try:
+        while not shutdown_event.is_set():
+            if not buffer:
+                jobs, next_due = pick_next_jobs(worker_id, batch_size)
+                buffer.extend(jobs)
+            
+            if not buffer:
+                # No jobs available: sleep until the next one is due, but
+                # re-poll at least every poll_interval, since new jobs are
+                # enqueued by other (CLI) processes; a shutdown request ends
+                # the wait at once
+                sleep_for = poll_interval if next_due is None else min(poll_interval, next_due)
+                if shutdown_event.wait(timeout=sleep_for):
+                    break
+                continue
+            
+            job = buffer.popleft()
+            job_id = job['id']
+            attempts = job['attempts']
+            max_retries = job['max_retries']
         
-        # Execute the job
-        success, output, error = execute_job(job, timeout)
-        now = now_iso()
+            # Execute the job
+            success, output, error = execute_job(job, timeout)
+            now = now_ts()
         
-        conn = _connect()
-        try:
-            with conn:
-                if success:
-                    # Job succeeded
-                    conn.execute("""
-                        UPDATE jobs
-                        SET state = 'completed',
-                            attempts = attempts + 1,
-                            updated_at = ?,
-                            output = ?,
-                            last_error = NULL,
-                            picked_by = NULL
-                        WHERE id = ?
-                    """, (now, output[:10000], job_id))  # Limit output size
+            if success:
+                # Job succeeded
+                _writes.put(('done', (now, output, job_id)))  # Already trimmed to OUTPUT_LIMIT
+            else:
+                # Job failed
+                new_attempts = attempts + 1
+            
+                if new_attempts > max_retries:
+                    # Move to DLQ
+                    _writes.put(('dead', (new_attempts, now, error, job_id)))
                 else:
-                    # Job failed
-                    new_attempts = attempts + 1
-                    
-                    if new_attempts > max_retries:
-                        # Move to DLQ
-                        conn.execute("""
-                            UPDATE jobs
-                            SET state = 'dead',
-                                attempts = ?,
-                                updated_at = ?,
-                                last_error = ?,
-                                picked_by = NULL
-                            WHERE id = ?
-                        """, (new_attempts, now, error, job_id))
-                    else:
-                        # Schedule retry with exponential backoff
-                        delay_seconds = calculate_backoff_delay(new_attempts, backoff_base)
-                        try:
-                            now = dt.datetime.now(dt.timezone.utc)
-                            due_at = (now + dt.timedelta(seconds=delay_seconds)).isoformat().replace('+00:00', 'Z')
-                        except AttributeError:
-                            due_at = (dt.datetime.utcnow() + dt.timedelta(seconds=delay_seconds)).isoformat() + "Z"
-                        
-                        conn.execute("""
-                            UPDATE jobs
-                            SET state = 'failed',
-                                attempts = ?,
-                                updated_at = ?,
-                                due_at = ?,
-                                last_error = ?,
-                                picked_by = NULL
-                            WHERE id = ?
-                        """, (new_attempts, now, due_at, error, job_id))
-        finally:
-            conn.close()
-        
-        # Small delay before picking next job
-        time.sleep(0.1)
+                    # Schedule retry with exponential backoff
+                    delay_seconds = calculate_backoff_delay(new_attempts, backoff_base)
+                    due_at = now + math.ceil(delay_seconds)
+                
+                    _writes.put(('retry', (new_attempts, now, due_at, error, job_id)))
+    finally:
+        # Don't strand claimed jobs in 'processing' when shutting down
+        release_jobs(worker_id, [j['id'] for j in buffer])
 
-def worker_process(worker_id: str, shutdown_event: multiprocessing.Event):
-    """Worker process entry point"""
-    # Update heartbeat periodically
-    def heartbeat_loop():
-        while not shutdown_event.is_set():
+def flush_writes(conn, entries: list[tuple]):
+    """Commit a batch of queued job results and heartbeats in a single transaction"""
+    by_kind = {}
+    heartbeats = set()
+    for kind, params in entries:
+        if kind == 'hb':
+            heartbeats.add(params)  # Repeated beats of a worker collapse into one
+        else:
+            by_kind.setdefault(kind, []).append(params)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for kind, rows in by_kind.items():
+            conn.executemany(_WRITE_SQL[kind], rows)
+        if heartbeats:
+            placeholders = ','.join('?' * len(heartbeats))
+            conn.execute(SQL_HEARTBEAT.format(placeholders=placeholders),
+                         (now_ts(), *sorted(heartbeats)))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+def writer_loop(worker_ids=(), heartbeat_interval: float = 0, shutdown_event=None):
+    """Drain the result queue, committing everything pending at once.
+    With a positive heartbeat_interval, worker_ids' heartbeats are refreshed
+    at most that often as part of a flush. If the writer exits without
+    committing everything, shutdown_event (when given) is set so workers
+    stop claiming jobs whose results could not be saved."""
+    conn = _conn()
+    last_beat = time.monotonic()
+    stopping = False
+    pending = []  # Entries of a batch that failed to commit
+    retry_delay = WRITE_RETRY_DELAY
+    exit_failures = 0
+    try:
+        while not stopping or pending:
+            wait = None
+            if pending:
+                wait = 0  # Already backed off; retry with whatever is queued
+            elif heartbeat_interval > 0:
+                wait = max(0.0, last_beat + heartbeat_interval - time.monotonic())
             try:
-                conn = _connect()
+                entries = [_writes.get(timeout=wait)]
+            except queue.Empty:
+                entries = []
+            # Whatever piled up while the last commit ran goes into this one
+            while True:
                 try:
-                    with conn:
-                        conn.execute("""
-                            UPDATE workers
-                            SET heartbeat_at = ?
-                            WHERE id = ?
-                        """, (now_iso(), worker_id))
-                finally:
-                    conn.close()
-            except:
-                pass
-            time.sleep(5)  # Heartbeat every 5 seconds
-    
-    # Start heartbeat thread
-    heartbeat_thread = threading.Thread(target=heartbeat_loop, daemon=True)
-    heartbeat_thread.start()
-    
-    # Convert multiprocessing.Event to threading.Event for process_job
-    thread_shutdown = threading.Event()
-    
-    def check_shutdown():
-        while not shutdown_event.is_set():
-            time.sleep(0.1)
-        thread_shutdown.set()
+                    entries.append(_writes.get_nowait())
+                except queue.Empty:
+                    break
+            if None in entries:
+                stopping = True
+                entries = [e for e in entries if e is not None]
+            if heartbeat_interval > 0 and time.monotonic() - last_beat >= heartbeat_interval:
+                entries.extend(('hb', wid) for wid in worker_ids)
+                last_beat = time.monotonic()
+            entries = pending + entries
+            if not entries:
+                continue
+            try:
+                flush_writes(conn, entries)
+            except sqlite3.Error as e:
+                if stopping:
+                    exit_failures += 1
+                    if exit_failures > WRITE_RETRIES_ON_EXIT:
+                        raise
+                print(f"Failed to write {len(entries)} job result(s), "
+                      f"retrying in {retry_delay:g}s: {e}", file=sys.stderr)
+                pending = entries
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, WRITE_RETRY_MAX_DELAY)
+                continue
+            pending = []
+            retry_delay = WRITE_RETRY_DELAY
+        _writes_flushed.set()
+    finally:
+        if not _writes_flushed.is_set() and shutdown_event is not None:
+            shutdown_event.set()
+
+def worker_process(worker_id: str, shutdown_event: multiprocessing.Event, cfg: dict):
+    """Worker process entry point; cfg is the config snapshot taken by start_workers"""
+    # Handlers installed by start_workers are inherited on fork; here a
+    # SIGTERM (sent by `worker stop`) just asks this worker to finish up.
+    # Event.set() waits for sleepers to wake, and the handler may have
+    # interrupted this very thread inside Event.wait(), so set it from
+    # another thread.
+    def request_stop(signum, frame):
+        threading.Thread(target=shutdown_event.set, daemon=True).start()
+    
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, request_stop)
+    # Ctrl-C reaches the whole process group; only the parent acts on it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
     
-    shutdown_checker = threading.Thread(target=check_shutdown, daemon=True)
-    shutdown_checker.start()
+    # Job results are committed by a single writer thread. heartbeat_at is
+    # written on every status change; periodic refreshes are opt-in via the
+    # heartbeat_interval config and ride along with the writer's flushes.
+    heartbeat_interval = float(cfg["heartbeat_interval"])
+    writer_thread = threading.Thread(target=writer_loop,
+                                     args=([worker_id], heartbeat_interval, shutdown_event),
+                                     daemon=True)
+    writer_thread.start()
     
     # Main processing loop
     try:
-        process_job(worker_id, thread_shutdown)
+        process_job(worker_id, shutdown_event, cfg)
     except KeyboardInterrupt:
         pass
     finally:
+        # Flush outstanding results before reporting the worker as stopped
+        _writes.put(None)
+        writer_thread.join()
+        
         # Mark worker as stopped
-        conn = _connect()
-        try:
-            with conn:
-                conn.execute("""
-                    UPDATE workers
-                    SET status = 'stopped',
-                        stopped_at = ?
-                    WHERE id = ?
-                """, (now_iso(), worker_id))
-        finally:
-            conn.close()
+        conn = _conn()
+        conn.execute("""
+            UPDATE workers
+            SET status = 'stopped',
+                heartbeat_at = ?,
+                stopped_at = ?
+            WHERE id = ?
+        """, (now_ts(), now_ts(), worker_id))
+        
+        # The writer gave up (or crashed); its jobs are left in 'processing'
+        if not _writes_flushed.is_set():
+            print(f"{worker_id}: not all job results could be saved", file=sys.stderr)
+            sys.exit(1)
 
 # Global storage for worker processes (for graceful shutdown)
 _worker_processes = []
@@ -406,30 +821,34 @@ def start_workers(count: int):
     processes = []
     worker_ids = []
     
-    # Set up signal handler for graceful shutdown
+    # Signal handlers only record the request; the wait loop below does the
+    # actual shutdown outside of signal context, where it can't interleave
+    # with multiprocessing's own locking. Event.set() takes the event's lock,
+    # and a second signal (Ctrl-C then SIGTERM) can land while the first
+    # handler holds it, so set it from another thread, as workers do.
+    main_shutdown = threading.Event()
+    
     def signal_handler(sig, frame):
-        print("\nReceived shutdown signal, stopping workers...")
-        stop_workers()
-        sys.exit(0)
+        threading.Thread(target=main_shutdown.set, daemon=True).start()
     
     signal.signal(signal.SIGINT, signal_handler)
     if hasattr(signal, 'SIGTERM'):
         signal.signal(signal.SIGTERM, signal_handler)
     
+    # Read config once here and hand it to every worker, instead of each
+    # child querying it again on startup
+    cfg = get_config()
+    
     for i in range(count):
         worker_id = f"worker-{uuid.uuid4().hex[:8]}"
         worker_ids.append(worker_id)
         
         # Register worker in DB
-        conn = _connect()
-        try:
-            with conn:
-                conn.execute("""
-                    INSERT INTO workers(id, pid, status, started_at, heartbeat_at)
-                    VALUES(?, ?, ?, ?, ?)
-                """, (worker_id, os.getpid(), "starting", now_iso(), now_iso()))
-        finally:
-            conn.close()
+        conn = _conn()
+        conn.execute("""
+            INSERT INTO workers(id, pid, status, started_at, heartbeat_at)
+            VALUES(?, ?, ?, ?, ?)
+        """, (worker_id, os.getpid(), "starting", now_ts(), now_ts()))
         
         # Create shutdown event
         shutdown_event = multiprocessing.Event()
@@ -437,23 +856,20 @@ def start_workers(count: int):
         # Start worker process
         proc = multiprocessing.Process(
             target=worker_process,
-            args=(worker_id, shutdown_event),
+            args=(worker_id, shutdown_event, cfg),
             daemon=False
         )
         proc.start()
         
         # Update worker with actual PID
-        conn = _connect()
-        try:
-            with conn:
-                conn.execute("""
-                    UPDATE workers
-                    SET pid = ?,
-                        status = 'running'
-                    WHERE id = ?
-                """, (proc.pid, worker_id))
-        finally:
-            conn.close()
+        conn = _conn()
+        conn.execute("""
+            UPDATE workers
+            SET pid = ?,
+                status = 'running',
+                heartbeat_at = ?
+            WHERE id = ?
+        """, (proc.pid, now_ts(), worker_id))
         
         processes.append((proc, shutdown_event, worker_id))
         _worker_processes.append((proc, shutdown_event, worker_id))
@@ -462,89 +878,151 @@ def start_workers(count: int):
     for proc, _, wid in processes:
         print(f"  {wid} (PID: {proc.pid})")
     
-    # Wait for all processes
-    try:
+    # Wait for all processes, or for a shutdown request
+    while any(proc.is_alive() for proc, _, _ in processes):
+        if main_shutdown.wait(0.5):
+            print("\nReceived shutdown signal, stopping workers...")
+            stop_workers()
+            break
         for proc, _, _ in processes:
-            proc.join()
-    except KeyboardInterrupt:
-        print("\nShutting down workers...")
-        stop_workers()
+            proc.join(0)
 
-def stop_workers():
-    """Stop all running workers gracefully"""
+def start_thread_workers(count: int):
+    """Run count workers as threads of this process, sharing one writer thread"""
+    # Same shutdown handling as start_workers (the event is set from a helper
+    # thread, so back-to-back signals can't deadlock on its lock); the worker
+    # threads watch main_shutdown directly
+    main_shutdown = threading.Event()
+    
+    def signal_handler(sig, frame):
+        threading.Thread(target=main_shutdown.set, daemon=True).start()
+    
+    signal.signal(signal.SIGINT, signal_handler)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, signal_handler)
+    
+    cfg = get_config()
+    worker_ids = [f"worker-{uuid.uuid4().hex[:8]}" for _ in range(count)]
+    
+    # Every thread worker is registered under this process's PID, so
+    # `worker stop` reaches them all with one SIGTERM
+    conn = _conn()
+    for worker_id in worker_ids:
+        conn.execute("""
+            INSERT INTO workers(id, pid, status, started_at, heartbeat_at)
+            VALUES(?, ?, ?, ?, ?)
+        """, (worker_id, os.getpid(), "running", now_ts(), now_ts()))
+    
+    writer_thread = threading.Thread(target=writer_loop,
+                                     args=(worker_ids, float(cfg["heartbeat_interval"]),
+                                           main_shutdown),
+                                     daemon=True)
+    writer_thread.start()
+    
+    threads = [threading.Thread(target=process_job, args=(worker_id, main_shutdown, cfg),
+                                daemon=True)
+               for worker_id in worker_ids]
+    for thread in threads:
+        thread.start()
+    
+    print(f"Started {count} worker thread(s) (PID: {os.getpid()})")
+    for worker_id in worker_ids:
+        print(f"  {worker_id}")
+    
+    # Wait for a shutdown request; workers finish their current job first
+    while any(thread.is_alive() for thread in threads):
+        if main_shutdown.wait(0.5):
+            print("\nReceived shutdown signal, stopping workers...")
+            break
+    for thread in threads:
+        thread.join()
+    
+    # Flush outstanding results before reporting the workers as stopped
+    _writes.put(None)
+    writer_thread.join()
+    
+    placeholders = ','.join('?' * len(worker_ids))
+    conn.execute(f"""
+        UPDATE workers
+        SET status = 'stopped',
+            heartbeat_at = ?,
+            stopped_at = ?
+        WHERE id IN ({placeholders})
+    """, (now_ts(), now_ts(), *worker_ids))
+    
+    # The writer gave up (or crashed); its jobs are left in 'processing'
+    if not _writes_flushed.is_set():
+        sys.exit("Stopped workers, but not all job results could be saved")
+    print("Stopped workers")
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)  # Raises if the process doesn't exist
+    except OSError:
+        return False
+    return True
+
+def stop_workers(grace: float = 5.0):
+    """Stop all running workers, giving them `grace` seconds to finish
+    their current job before they are terminated and then killed"""
     global _worker_processes
     
-    # First, signal all worker processes via their shutdown events
+    # Signal our own worker processes via their shutdown events
     for proc, shutdown_event, worker_id in _worker_processes:
-        if proc.is_alive():
-            shutdown_event.set()
+        shutdown_event.set()
     
-    # Also check DB for any workers
-    conn = _connect()
+    # Also check DB for workers started by another `queuectl worker start`
+    conn = _conn()
     workers = conn.execute("""
         SELECT id, pid FROM workers WHERE status = 'running'
     """).fetchall()
-    conn.close()
     
     if not workers and not _worker_processes:
         print("No workers running")
         return
     
-    # Wait a bit for graceful shutdown
-    time.sleep(2)
-    
-    # Force terminate processes that are still alive
-    for proc, _, worker_id in _worker_processes:
-        if proc.is_alive():
-            try:
-                proc.terminate()
-                proc.join(timeout=1)
-                if proc.is_alive():
-                    proc.kill()
-            except:
-                pass
-    
-    # Also try to kill by PID from DB
-    for w in workers:
+    # Those are only reachable by PID; SIGTERM asks them to stop. Thread
+    # workers all share their pool's PID, which gets a single signal.
+    own_pids = {proc.pid for proc, _, _ in _worker_processes}
+    foreign_pids = set()
+    for pid in {w['pid'] for w in workers} - own_pids:
         try:
-            # Check if process is still running
-            os.kill(w['pid'], 0)  # This will raise if process doesn't exist
-            # Process exists, try to terminate
-            if os.name == 'nt':  # Windows
-                os.kill(w['pid'], signal.SIGTERM)
-            else:  # Unix
-                os.kill(w['pid'], signal.SIGTERM)
-        except (ProcessLookupError, OSError):
+            os.kill(pid, signal.SIGTERM)
+            foreign_pids.add(pid)
+        except OSError:
             pass  # Process already dead
-        except Exception as e:
-            print(f"Error stopping worker {w['id']}: {e}")
     
-    # Wait a bit more
-    time.sleep(1)
+    # Wait only as long as it takes everyone to exit, up to the grace period
+    deadline = time.monotonic() + grace
+    for proc, _, _ in _worker_processes:
+        proc.join(timeout=max(0, deadline - time.monotonic()))
+    while foreign_pids and time.monotonic() < deadline:
+        foreign_pids = {pid for pid in foreign_pids if _pid_alive(pid)}
+        if foreign_pids:
+            time.sleep(0.1)
     
-    # Force kill if still running
-    for w in workers:
+    # Escalate for anything that ignored the request
+    for proc, _, _ in _worker_processes:
+        if proc.is_alive():
+            proc.terminate()
+            proc.join(timeout=1)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+    for pid in foreign_pids:
         try:
-            os.kill(w['pid'], 0)  # Check if alive
-            if os.name == 'nt':  # Windows
-                os.kill(w['pid'], signal.SIGTERM)
-            else:
-                os.kill(w['pid'], signal.SIGKILL)
-        except:
+            os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        except OSError:
             pass
     
     # Mark as stopped
-    conn = _connect()
-    try:
-        with conn:
-            conn.execute("""
-                UPDATE workers
-                SET status = 'stopped',
-                    stopped_at = ?
-                WHERE status = 'running'
-            """, (now_iso(),))
-    finally:
-        conn.close()
+    conn = _conn()
+    conn.execute("""
+        UPDATE workers
+        SET status = 'stopped',
+            stopped_at = ?
+        WHERE status = 'running'
+    """, (now_ts(),))
     
     _worker_processes.clear()
     print(f"Stopped workers")
@@ -552,14 +1030,13 @@ def stop_workers():
 # ---------------- DLQ Operations ---------------- 
 def dlq_list():
     """List all jobs in the Dead Letter Queue"""
-    conn = _connect()
+    conn = _conn()
     jobs = conn.execute("""
         SELECT id, command, attempts, max_retries, last_error, created_at, updated_at
         FROM jobs
         WHERE state = 'dead'
         ORDER BY updated_at DESC
     """).fetchall()
-    conn.close()
     
     if not jobs:
         print("(no jobs in DLQ)")
@@ -571,30 +1048,26 @@ def dlq_list():
         print(f"  Command: {j['command']}")
         print(f"  Attempts: {j['attempts']}/{j['max_retries']}")
         print(f"  Last Error: {j['last_error']}")
-        print(f"  Created: {j['created_at']}")
-        print(f"  Failed: {j['updated_at']}")
+        print(f"  Created: {fmt_ts(j['created_at'])}")
+        print(f"  Failed: {fmt_ts(j['updated_at'])}")
 
 def dlq_retry(job_id: str):
     """Retry a job from the DLQ by resetting it to pending"""
-    conn = _connect()
-    try:
-        with conn:
-            result = conn.execute("""
-                UPDATE jobs
-                SET state = 'pending',
-                    attempts = 0,
-                    due_at = ?,
-                    updated_at = ?,
-                    last_error = NULL,
-                    picked_by = NULL
-                WHERE id = ? AND state = 'dead'
-                RETURNING id
-            """, (now_iso(), now_iso(), job_id)).fetchone()
-            
-            if not result:
-                sys.exit(f"Job '{job_id}' not found in DLQ")
-    finally:
-        conn.close()
+    conn = _conn()
+    result = conn.execute("""
+        UPDATE jobs
+        SET state = 'pending',
+            attempts = 0,
+            due_at = ?,
+            updated_at = ?,
+            last_error = NULL,
+            picked_by = NULL
+        WHERE id = ? AND state = 'dead'
+        RETURNING id
+    """, (now_ts(), now_ts(), job_id)).fetchone()
+    
+    if not result:
+        sys.exit(f"Job '{job_id}' not found in DLQ")
     
     print(f"Reset job '{job_id}' to pending (will retry from beginning)")
 
@@ -607,10 +1080,19 @@ def build_parser():
     sp.add_argument("job_json", help="Job JSON: {id?, command, max_retries?, run_at?, priority?}")
     sp.set_defaults(func=lambda a: enqueue_job(a.job_json))
 
+    sp = sub.add_parser("enqueue-batch", help="Add many jobs in one transaction")
+    sp.add_argument("jobs_json", nargs="?", help="JSON array of jobs (otherwise read from --file)")
+    sp.add_argument("--file", default="-", help="File with one job JSON per line (default: stdin)")
+    sp.set_defaults(func=lambda a: enqueue_batch(a.file, a.jobs_json))
+
     sp = sub.add_parser("list", help="List jobs (optionally by state)")
     sp.add_argument("--state", choices=["pending","processing","completed","failed","dead"])
     sp.set_defaults(func=lambda a: list_jobs(a.state))
 
+    sp = sub.add_parser("inspect", help="Show one job as JSON")
+    sp.add_argument("job_id", help="Job ID to show")
+    sp.set_defaults(func=lambda a: inspect_job(a.job_id))
+
     sp = sub.add_parser("status", help="Show job/worker status")
     sp.set_defaults(func=lambda a: status_summary())
 
@@ -626,8 +1108,10 @@ def build_parser():
     wsp = sub.add_parser("worker", help="Worker process commands")
     wsub = wsp.add_subparsers(dest="wcmd", required=True)
     ws = wsub.add_parser("start", help="Start workers")
-    ws.add_argument("--count", type=int, default=1, help="Number of workers to start (default: 1)")
-    ws.set_defaults(func=lambda a: start_workers(a.count))
+    wmode = ws.add_mutually_exclusive_group()
+    wmode.add_argument("--count", type=int, default=1, help="Number of workers to start (default: 1)")
+    wmode.add_argument("--threads", type=int, help="Run this many workers as threads of one process")
+    ws.set_defaults(func=lambda a: start_thread_workers(a.threads) if a.threads else start_workers(a.count))
     wst = wsub.add_parser("stop", help="Stop all running workers gracefully")
     wst.set_defaults(func=lambda a: stop_workers())
 
@@ -646,7 +1130,12 @@ def main(argv=None):
     parser = build_parser()
     args = parser.parse_args(argv)
     if hasattr(args, "func"):
-        args.func(args)
+        try:
+            args.func(args)
+        except sqlite3.OperationalError as e:
+            if not _is_readonly_error(e):
+                raise
+            sys.exit(f"Cannot run '{args.cmd}': the database is read-only.")
     else:
         parser.print_help()
 
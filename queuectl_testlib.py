@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Helpers shared by test_queuectl.py and validate_all_requirements.py
+
+Importing this module replaces sys.stdout/sys.stderr with ThreadOutput, so
+tests running on different threads can capture their own output. Set
+QUEUECTL_DB before importing it; queuectl reads its environment on import.
+"""
+import subprocess
+import signal
+import sqlite3
+import contextlib
+import tempfile
+import threading
+import io
+import time
+import json
+import os
+import sys
+
+class ThreadOutput:
+    """Stand-in for sys.stdout/sys.stderr that lets each thread redirect its
+    own output; contextlib.redirect_stdout swaps the stream for every thread"""
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def redirect(self, target):
+        previous = getattr(self._local, 'target', None)
+        self._local.target = target
+        try:
+            yield target
+        finally:
+            self._local.target = previous
+
+    def _target(self):
+        return getattr(self._local, 'target', None) or self._default
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+# Tests run concurrently, so output is captured per thread
+sys.stdout = ThreadOutput(sys.stdout)
+sys.stderr = ThreadOutput(sys.stderr)
+
+import queuectl
+
+# The database the CLI commands below operate on, resolved the way
+# queuectl resolves it (QUEUECTL_DB, DATABASE_URL, default)
+DB_FILE = queuectl._db_path()
+
+# Created by the DLQ retry job on its first run
+DLQ_MARKER = "test-dlq-retry.marker"
+
+def _exit_code(exc):
+    """Map a SystemExit raised by the CLI to a process return code"""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    # sys.exit("message") prints the message and exits with 1
+    print(exc.code, file=sys.stderr)
+    return 1
+
+def run_cmd(parts, check=True, timeout=30):
+    """Run a queuectl command, returning (stdout, returncode); stdout is
+    None if the command failed and check is set"""
+    # Arguments must already be split; JSON arguments contain spaces
+    if isinstance(parts, str):
+        raise TypeError("run_cmd expects a list of arguments, not a string")
+
+    # Workers have to live in their own process; everything else is
+    # dispatched in-process to skip an interpreter start per command
+    if parts[:2] == ["worker", "start"]:
+        try:
+            result = subprocess.run(
+                ["python", "-I", "queuectl.py"] + parts,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            print(f"❌ Command timed out: queuectl {' '.join(parts)}")
+            return None, -1
+        returncode, stdout, stderr = result.returncode, result.stdout, result.stderr
+    else:
+        out, err = io.StringIO(), io.StringIO()
+        try:
+            with sys.stdout.redirect(out), sys.stderr.redirect(err):
+                try:
+                    queuectl.main(parts)
+                    returncode = 0
+                except SystemExit as e:
+                    returncode = _exit_code(e)
+        except Exception as e:
+            print(f"❌ Error running command: {e}")
+            return None, -1
+        stdout, stderr = out.getvalue(), err.getvalue()
+
+    if check and returncode != 0:
+        print(f"❌ Command failed: queuectl {' '.join(parts)}")
+        print(f"   Error: {stderr}")
+        return None, returncode
+    return stdout, returncode
+
+def _rm(path):
+    """Remove a file if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def job_spec(job_id, command, **fields):
+    """Job dict in the shape enqueue/enqueue-batch accept"""
+    return {"id": job_id, "command": command, **fields}
+
+def job_payload(job_id, command, **fields):
+    """JSON argument for `enqueue`"""
+    return json.dumps(job_spec(job_id, command, **fields))
+
+def wait_for(predicate, timeout, interval=0.1):
+    """Poll predicate every interval seconds until it holds or timeout passes"""
+    deadline = time.monotonic() + timeout
+    while True:
+        if predicate():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+
+# State checks read the database directly over one read-only connection
+# instead of going through the CLI; it is shared by the test threads
+_ro_conn = None
+_ro_lock = threading.Lock()
+
+def ro_conn():
+    """Shared read-only connection to the queue database"""
+    global _ro_conn
+    with _ro_lock:
+        if _ro_conn is None:
+            _ro_conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True,
+                                       isolation_level=None, check_same_thread=False)
+            _ro_conn.execute("PRAGMA query_only=1")
+        return _ro_conn
+
+def close_ro_conn():
+    global _ro_conn
+    if _ro_conn is not None:
+        _ro_conn.close()
+        _ro_conn = None
+
+def count_completed(prefix):
+    """Number of completed jobs whose id starts with prefix"""
+    return ro_conn().execute("SELECT COUNT(*) FROM jobs WHERE state = 'completed' AND id LIKE ?",
+                             (prefix + "%",)).fetchone()[0]
+
+def job_in_state(job_id, *states):
+    """Check whether job_id is currently in any of states"""
+    placeholders = ",".join("?" * len(states))
+    row = ro_conn().execute(f"SELECT 1 FROM jobs WHERE id = ? AND state IN ({placeholders})",
+                            (job_id, *states)).fetchone()
+    return row is not None
+
+def in_dlq(job_id):
+    """Check whether job_id is in the Dead Letter Queue (state 'dead')"""
+    row = ro_conn().execute("SELECT 1 FROM jobs WHERE id = ? AND state = 'dead' LIMIT 1",
+                            (job_id,)).fetchone()
+    return row is not None
+
+def wait_for_job(job_id, state, timeout):
+    """Wait until job_id is in state, checked directly in the database"""
+    return wait_for(lambda: job_in_state(job_id, state), timeout)
+
+# Worker subprocesses start in isolated mode (-I): no user site-packages
+# or PYTHON* variables to scan. -S would be faster still, but it also drops
+# site-packages, where python-dotenv is installed.
+def start_worker_pool(worker_args, log):
+    """Start the worker pool shared by every test; worker_args follow
+    `worker start`, e.g. ["--threads", "3"], and its stderr goes to log"""
+    return subprocess.Popen(
+        ["python", "-I", "queuectl.py", "worker", "start", *worker_args],
+        stdout=subprocess.DEVNULL,
+        stderr=log
+    )
+
+def workers_running_since(since):
+    """Check whether a worker started at or after since is registered as running"""
+    row = ro_conn().execute("SELECT 1 FROM workers WHERE status = 'running' AND started_at >= ? LIMIT 1",
+                            (since,)).fetchone()
+    return row is not None
+
+def pool_started(proc, since, timeout=10):
+    """Wait until the pool has registered its workers; False if it exits
+    (e.g. an import error under -I) or times out first"""
+    wait_for(lambda: proc.poll() is not None or workers_running_since(since), timeout)
+    return proc.poll() is None and workers_running_since(since)
+
+def stop_worker_pool(proc, grace=5.0):
+    """Ask the pool to shut down, killing it if it isn't gone after grace seconds"""
+    if proc.poll() is None:
+        # SIGINT is the pool's Ctrl-C path: workers finish their current job.
+        # Windows can't deliver SIGINT to a child, so terminate it there.
+        if os.name == 'nt':
+            proc.terminate()
+        else:
+            proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+@contextlib.contextmanager
+def worker_pool(worker_args):
+    """Run the shared worker pool for the duration of the with block.
+    Raises RuntimeError with the pool's stderr if it doesn't come up, rather
+    than leaving every test to time out waiting for its jobs."""
+    with tempfile.TemporaryFile(mode="w+") as log:
+        since = queuectl.now_ts()
+        proc = start_worker_pool(worker_args, log)
+        try:
+            if not pool_started(proc, since):
+                log.seek(0)
+                raise RuntimeError(f"Worker pool failed to start:\n{log.read()}")
+            yield proc
+        finally:
+            stop_worker_pool(proc)
+
+def run_test(name, test_func):
+    """Run one test, returning its result and everything it printed"""
+    with sys.stdout.redirect(io.StringIO()) as buf:
+        try:
+            result = test_func()
+        except Exception as e:
+            print(f"❌ Test '{name}' crashed: {e}")
+            result = False
+    return result, buf.getvalue()
@@ -3,96 +3,56 @@
 """
 Test script for QueueCTL - validates core functionality
 """
-import subprocess
-import time
 import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-# Fix encoding for Windows
+# Fix encoding for Windows (in place, without stacking another text layer)
 if sys.platform == 'win32':
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    sys.stderr.reconfigure(encoding='utf-8', errors='replace')
 
-# Use a test database
+# Use a test database (must be set before queuectl reads its environment)
 TEST_DB = "test_queuectl.db"
 os.environ["QUEUECTL_DB"] = TEST_DB
 
-def run_cmd(cmd, check=True):
-    """Run a queuectl command and return output"""
-    try:
-        # Handle commands that need JSON - pass as list to avoid shell parsing issues
-        if isinstance(cmd, str):
-            parts = cmd.split()
-        else:
-            parts = cmd
-        
-        result = subprocess.run(
-            ["python", "queuectl.py"] + parts,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        if check and result.returncode != 0:
-            print(f"❌ Command failed: queuectl {' '.join(parts)}")
-            print(f"   Error: {result.stderr}")
-            return None
-        return result.stdout
-    except subprocess.TimeoutExpired:
-        print(f"❌ Command timed out: queuectl {' '.join(parts)}")
-        return None
-    except Exception as e:
-        print(f"❌ Error running command: {e}")
-        return None
+import queuectl
+from queuectl_testlib import (
+    DLQ_MARKER, _rm, close_ro_conn, count_completed, in_dlq, job_in_state,
+    job_payload, job_spec, run_cmd, run_test, wait_for, wait_for_job, worker_pool,
+)
 
 def cleanup():
     """Clean up test database"""
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
-    if os.path.exists(".workers.json"):
-        os.remove(".workers.json")
+    # Drop our cached connections so the next command opens the new file
+    queuectl._close_conn()
+    close_ro_conn()
+    # WAL mode keeps -wal/-shm sidecars next to the database file
+    for path in (TEST_DB, TEST_DB + "-wal", TEST_DB + "-shm", ".workers.json", DLQ_MARKER):
+        _rm(path)
 
 def test_basic_job_completion():
     """Test 1: Basic job completes successfully"""
     print("\n🧪 Test 1: Basic Job Completion")
     print("-" * 50)
     
-    cleanup()
-    
     # Enqueue a simple job
     job_id = "test-success-1"
-    job_data = {"id": job_id, "command": "echo Test Success"}
-    job_json = json.dumps(job_data)
-    output = run_cmd(["enqueue", job_json])
+    job_json = job_payload(job_id, "echo Test Success")
+    output, _ = run_cmd(["enqueue", job_json])
     if not output or job_id not in output:
         print("❌ Failed to enqueue job")
         return False
     
     print(f"✅ Enqueued job: {job_id}")
     
-    # Start a worker
-    print("Starting worker...")
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
-    # Wait for job to complete
-    time.sleep(3)
-    
-    # Check if job completed
-    output = run_cmd(["list", "--state", "completed"], check=False)
-    if output and job_id in output:
+    # Wait for the worker pool to complete it
+    if wait_for_job(job_id, "completed", timeout=10):
         print(f"✅ Job {job_id} completed successfully")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return True
     else:
         print(f"❌ Job {job_id} did not complete")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
 
 def test_retry_and_dlq():
@@ -100,45 +60,25 @@ def test_retry_and_dlq():
     print("\n🧪 Test 2: Retry and DLQ")
     print("-" * 50)
     
-    cleanup()
-    
-    # Set max retries to 2 for faster testing
-    run_cmd(["config", "set", "max_retries", "2"])
-    run_cmd(["config", "set", "backoff_base", "2"])
-    
-    # Enqueue a job that will fail
+    # Enqueue a job that will fail; it carries its own max_retries, and the
+    # running workers use the default backoff_base of 2
     job_id = "test-fail-1"
-    job_json = json.dumps({"id": job_id, "command": "exit 1"})
-    output = run_cmd(["enqueue", job_json])
+    job_json = job_payload(job_id, "exit 1", max_retries=2)
+    output, _ = run_cmd(["enqueue", job_json])
     if not output:
         print("❌ Failed to enqueue job")
         return False
     
     print(f"✅ Enqueued failing job: {job_id}")
     
-    # Start a worker
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
     # Wait for retries (with backoff: 2^1=2s, 2^2=4s, then DLQ)
     print("Waiting for retries and DLQ...")
-    time.sleep(10)
-    
-    # Check DLQ
-    output = run_cmd(["dlq", "list"], check=False)
-    if output and job_id in output:
+    if wait_for(lambda: in_dlq(job_id), timeout=20):
         print(f"✅ Job {job_id} moved to DLQ after retries")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return True
     else:
         print(f"❌ Job {job_id} did not reach DLQ")
-        print(f"   Status output: {run_cmd('status', check=False)}")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
+        print(f"   Status output: {run_cmd(['status'], check=False)[0]}")
         return False
 
 def test_multiple_workers():
@@ -146,41 +86,24 @@ def test_multiple_workers():
     print("\n🧪 Test 3: Multiple Workers")
     print("-" * 50)
     
-    cleanup()
-    
-    # Enqueue multiple jobs
-    job_ids = []
-    for i in range(5):
-        job_id = f"test-multi-{i}"
-        job_ids.append(job_id)
-        job_json = json.dumps({"id": job_id, "command": f"echo Job {i}"})
-        run_cmd(["enqueue", job_json])
+    # Enqueue multiple jobs in one batch
+    jobs = [job_spec(f"test-multi-{i}", f"echo Job {i}") for i in range(5)]
+    job_ids = [job["id"] for job in jobs]
+    if not run_cmd(["enqueue-batch", json.dumps(jobs)])[0]:
+        print("❌ Failed to enqueue jobs")
+        return False
     
     print(f"✅ Enqueued {len(job_ids)} jobs")
     
-    # Start 3 workers
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "3"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
     # Wait for jobs to complete
-    time.sleep(5)
-    
-    # Check completed jobs
-    output = run_cmd(["list", "--state", "completed"], check=False)
-    completed_count = output.count("completed") if output else 0
+    wait_for(lambda: count_completed("test-multi-") >= len(job_ids), timeout=10)
+    completed_count = count_completed("test-multi-")
     
-    if completed_count >= len(job_ids):
+    if completed_count == len(job_ids):
         print(f"✅ All {len(job_ids)} jobs completed with multiple workers")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return True
     else:
         print(f"❌ Only {completed_count}/{len(job_ids)} jobs completed")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
 
 def test_invalid_command():
@@ -188,44 +111,25 @@ def test_invalid_command():
     print("\n🧪 Test 4: Invalid Command Handling")
     print("-" * 50)
     
-    cleanup()
-    
     # Enqueue a job with invalid command
     job_id = "test-invalid-1"
-    job_json = json.dumps({"id": job_id, "command": "nonexistent_command_xyz123"})
-    output = run_cmd(["enqueue", job_json])
+    job_json = job_payload(job_id, "nonexistent_command_xyz123")
+    output, _ = run_cmd(["enqueue", job_json])
     if not output:
         print("❌ Failed to enqueue job")
         return False
     
     print(f"✅ Enqueued job with invalid command: {job_id}")
     
-    # Start a worker
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
-    # Wait a bit
-    time.sleep(3)
-    
-    # Check that job failed (should be in failed or dead state)
-    output = run_cmd(["status"], check=False)
-    if output:
-        # Job should have failed
-        failed_output = run_cmd(["list", "--state", "failed"], check=False)
-        dead_output = run_cmd(["list", "--state", "dead"], check=False)
-        
-        if (failed_output and job_id in failed_output) or (dead_output and job_id in dead_output):
-            print(f"✅ Invalid command handled gracefully (job in failed/dead state)")
-            worker_proc.terminate()
-            worker_proc.wait(timeout=5)
-            return True
-    
-    print(f"❌ Invalid command not handled properly")
-    worker_proc.terminate()
-    worker_proc.wait(timeout=5)
+    # Job should have failed (failed or dead state)
+    wait_for(lambda: job_in_state(job_id, "failed", "dead"), timeout=10)
+    output, _ = run_cmd(["inspect", job_id], check=False)
+    state = json.loads(output)["state"] if output else None
+    if state in ("failed", "dead"):
+        print(f"✅ Invalid command handled gracefully (job {state})")
+        return True
+    
+    print(f"❌ Invalid command not handled properly (state: {state})")
     return False
 
 def test_persistence():
@@ -233,12 +137,10 @@ def test_persistence():
     print("\n🧪 Test 5: Persistence")
     print("-" * 50)
     
-    cleanup()
-    
     # Enqueue a job
     job_id = "test-persist-1"
-    job_json = json.dumps({"id": job_id, "command": "echo Persist Test"})
-    output = run_cmd(["enqueue", job_json])
+    job_json = job_payload(job_id, "echo Persist Test")
+    output, _ = run_cmd(["enqueue", job_json])
     if not output:
         print("❌ Failed to enqueue job")
         return False
@@ -246,15 +148,16 @@ def test_persistence():
     print(f"✅ Enqueued job: {job_id}")
     
     # Verify job exists
-    output = run_cmd(["list"], check=False)
+    output, _ = run_cmd(["list"], check=False)
     if not output or job_id not in output:
         print("❌ Job not found after enqueue")
         return False
     
     print("✅ Job found in database")
     
-    # Simulate restart (just check again without workers)
-    output = run_cmd(["list"], check=False)
+    # Simulate restart (drop our connection and read it back from disk)
+    queuectl._close_conn()
+    output, _ = run_cmd(["list"], check=False)
     if output and job_id in output:
         print(f"✅ Job persisted after 'restart'")
         return True
@@ -267,56 +170,38 @@ def test_dlq_retry():
     print("\n🧪 Test 6: DLQ Retry")
     print("-" * 50)
     
-    cleanup()
-    
-    # Set max retries to 1 for faster testing
-    run_cmd(["config", "set", "max_retries", "1"])
-    
-    # Enqueue a failing job
+    # The job fails on its first run and succeeds once the marker file
+    # exists, so a retried job can be told apart from the original run.
+    # With no retries allowed the first failure goes straight to the DLQ.
     job_id = "test-dlq-retry-1"
-    job_json = json.dumps({"id": job_id, "command": "exit 1"})
+    command = ("python -c \"import os, sys; "
+               f"sys.exit(0 if os.path.exists('{DLQ_MARKER}') "
+               f"else open('{DLQ_MARKER}', 'w').close() or 1)\"")
+    job_json = job_payload(job_id, command, max_retries=0)
     run_cmd(["enqueue", job_json])
     
-    # Start worker to move job to DLQ
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
-    time.sleep(5)
-    
     # Verify in DLQ
-    output = run_cmd("dlq list", check=False)
-    if not output or job_id not in output:
+    if not wait_for(lambda: in_dlq(job_id), timeout=10):
         print("❌ Job not in DLQ")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
     
     print(f"✅ Job {job_id} in DLQ")
     
     # Retry from DLQ
-    output = run_cmd(["dlq", "retry", job_id])
+    output, _ = run_cmd(["dlq", "retry", job_id])
     if not output or "pending" not in output.lower():
         print("❌ Failed to retry from DLQ")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
     
     print(f"✅ Job {job_id} retried from DLQ")
     
-    # Verify job is now pending
-    output = run_cmd(["list", "--state", "pending"], check=False)
-    if output and job_id in output:
-        print(f"✅ Job {job_id} is now pending")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
+    # The workers are still running, so the job is picked up again at once;
+    # check that the retried run completes
+    if wait_for_job(job_id, "completed", timeout=10):
+        print(f"✅ Job {job_id} ran again and completed")
         return True
     else:
-        print(f"❌ Job {job_id} not in pending state")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
+        print(f"❌ Job {job_id} was not re-run after retry")
         return False
 
 def main():
@@ -334,20 +219,21 @@ def main():
         ("DLQ Retry", test_dlq_retry),
     ]
     
+    # Start from an empty database and run every test against one pool
+    cleanup()
+    run_cmd(["status"], check=False)  # Create the schema before workers start
+    
     results = []
-    for name, test_func in tests:
-        try:
-            result = test_func()
-            results.append((name, result))
-            # Clean up between tests
-            time.sleep(1)
-        except Exception as e:
-            print(f"❌ Test '{name}' crashed: {e}")
-            results.append((name, False))
-        finally:
-            # Stop any running workers
-            run_cmd(["worker", "stop"], check=False)
-            time.sleep(1)
+    with worker_pool(["--threads", "3"]):
+        # Tests use their own job ids, so they can share the pool and run
+        # side by side; each test's output is printed once it finishes
+        with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+            futures = [(name, executor.submit(run_test, name, test_func))
+                       for name, test_func in tests]
+            for name, future in futures:
+                result, output = future.result()
+                sys.stdout.write(output)
+                results.append((name, result))
     
     # Final cleanup
     cleanup()
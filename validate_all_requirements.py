@@ -2,36 +2,20 @@
 """
 Comprehensive validation script for QueueCTL assignment requirements
 Tests all must-have features and scenarios
+
+Pass --fail-fast to stop starting new tests after the first failure
 """
-import subprocess
-import time
+import contextlib
+import graphlib
 import json
-import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-# Use main database for validation
-DB_FILE = "queuectl.db"
-
-def run_cmd(cmd_list, check=True, timeout=30):
-    """Run a queuectl command"""
-    try:
-        result = subprocess.run(
-            ["python", "queuectl.py"] + cmd_list,
-            capture_output=True,
-            text=True,
-            timeout=timeout
-        )
-        if check and result.returncode != 0:
-            print(f"❌ Command failed: {' '.join(cmd_list)}")
-            print(f"   Error: {result.stderr}")
-            return None, result.returncode
-        return result.stdout, result.returncode
-    except subprocess.TimeoutExpired:
-        print(f"❌ Command timed out: {' '.join(cmd_list)}")
-        return None, -1
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        return None, -1
+# Uses the main database (queuectl.db, or wherever QUEUECTL_DB points)
+from queuectl_testlib import (
+    DLQ_MARKER, _rm, count_completed, in_dlq, job_in_state, job_payload,
+    job_spec, run_cmd, run_test, wait_for, wait_for_job, worker_pool,
+)
 
 def print_section(title):
     """Print a section header"""
@@ -44,7 +28,7 @@ def test_1_basic_job_completion():
     print_section("TEST 1: Basic Job Completion")
     
     job_id = "test-basic-1"
-    job_json = json.dumps({"id": job_id, "command": "echo 'Test Success'"})
+    job_json = job_payload(job_id, "echo 'Test Success'")
     
     # Enqueue job
     output, code = run_cmd(["enqueue", job_json])
@@ -53,40 +37,24 @@ def test_1_basic_job_completion():
         return False
     print(f"✅ Enqueued job: {job_id}")
     
-    # Start worker
-    print("Starting worker...")
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
-    # Wait for completion
-    time.sleep(3)
-    
-    # Check if completed
-    output, _ = run_cmd(["list", "--state", "completed"], check=False)
-    if output and job_id in output:
+    # Wait for the worker pool to complete it
+    if wait_for_job(job_id, "completed", timeout=10):
         print(f"✅ PASS: Job {job_id} completed successfully")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return True
     else:
         print(f"❌ FAIL: Job {job_id} did not complete")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
 
 def test_2_retry_and_dlq():
     """Test 2: Failed job retries with backoff and moves to DLQ"""
     print_section("TEST 2: Retry with Exponential Backoff and DLQ")
     
-    # Configure retries
+    # Configure retries (backoff_base only reaches workers started after this)
     run_cmd(["config", "set", "max_retries", "2"])
     run_cmd(["config", "set", "backoff_base", "2"])
     
     job_id = "test-retry-dlq-1"
-    job_json = json.dumps({"id": job_id, "command": "exit 1"})
+    job_json = job_payload(job_id, "exit 1", max_retries=2)
     
     # Enqueue failing job
     output, _ = run_cmd(["enqueue", job_json])
@@ -95,69 +63,41 @@ def test_2_retry_and_dlq():
         return False
     print(f"✅ Enqueued failing job: {job_id}")
     
-    # Start worker
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
     # Wait for retries (2^1=2s, 2^2=4s, then DLQ)
-    print("Waiting for retries and DLQ (max 10 seconds)...")
-    time.sleep(10)
-    
-    # Check DLQ
-    output, _ = run_cmd(["dlq", "list"], check=False)
-    if output and job_id in output:
+    print("Waiting for retries and DLQ (max 30 seconds)...")
+    if wait_for(lambda: in_dlq(job_id), timeout=30):
         print(f"✅ PASS: Job {job_id} moved to DLQ after retries")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return True
     else:
         print(f"❌ FAIL: Job {job_id} did not reach DLQ")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
 
 def test_3_multiple_workers():
     """Test 3: Multiple workers process jobs without overlap"""
     print_section("TEST 3: Multiple Workers (No Overlap)")
     
-    # Enqueue multiple jobs
-    job_ids = []
-    for i in range(5):
-        job_id = f"test-multi-{i}"
-        job_ids.append(job_id)
-        job_json = json.dumps({"id": job_id, "command": f"echo 'Job {i}'"})
-        run_cmd(["enqueue", job_json])
+    # Enqueue multiple jobs in one batch
+    jobs = [job_spec(f"test-multi-{i}", f"echo 'Job {i}'") for i in range(5)]
+    job_ids = [job["id"] for job in jobs]
+    output, _ = run_cmd(["enqueue-batch", json.dumps(jobs)])
+    if not output:
+        print("❌ FAILED: Could not enqueue jobs")
+        return False
     
     print(f"✅ Enqueued {len(job_ids)} jobs")
     
-    # Start 3 workers
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "3"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
     # Wait for jobs to complete
     print("Waiting for jobs to complete...")
-    time.sleep(5)
+    wait_for(lambda: count_completed("test-multi-") >= len(job_ids), timeout=10)
     
-    # Check completed jobs
-    output, _ = run_cmd(["list", "--state", "completed"], check=False)
-    completed_count = output.count("completed") if output else 0
+    # Other tests' jobs share the database, so count only ours
+    completed_count = count_completed("test-multi-")
     
-    # Check for duplicate processing (should not have more completed than jobs)
-    if completed_count >= len(job_ids) and completed_count <= len(job_ids):
+    if completed_count == len(job_ids):
         print(f"✅ PASS: All {len(job_ids)} jobs completed without overlap")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return True
     else:
         print(f"❌ FAIL: Expected {len(job_ids)} completed, got {completed_count}")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
 
 def test_4_invalid_command():
@@ -165,7 +105,7 @@ def test_4_invalid_command():
     print_section("TEST 4: Invalid Command Handling")
     
     job_id = "test-invalid-1"
-    job_json = json.dumps({"id": job_id, "command": "nonexistent_command_xyz123"})
+    job_json = job_payload(job_id, "nonexistent_command_xyz123")
     
     # Enqueue job with invalid command
     output, _ = run_cmd(["enqueue", job_json])
@@ -174,29 +114,15 @@ def test_4_invalid_command():
         return False
     print(f"✅ Enqueued job with invalid command: {job_id}")
     
-    # Start worker
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
-    time.sleep(3)
-    
     # Check that job failed gracefully
-    output, _ = run_cmd(["status"], check=False)
-    failed_output, _ = run_cmd(["list", "--state", "failed"], check=False)
-    dead_output, _ = run_cmd(["list", "--state", "dead"], check=False)
-    
-    if (failed_output and job_id in failed_output) or (dead_output and job_id in dead_output):
-        print(f"✅ PASS: Invalid command handled gracefully")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
+    wait_for(lambda: job_in_state(job_id, "failed", "dead"), timeout=10)
+    output, _ = run_cmd(["inspect", job_id], check=False)
+    state = json.loads(output)["state"] if output else None
+    if state in ("failed", "dead"):
+        print(f"✅ PASS: Invalid command handled gracefully (job {state})")
         return True
     
-    print(f"❌ FAIL: Invalid command not handled properly")
-    worker_proc.terminate()
-    worker_proc.wait(timeout=5)
+    print(f"❌ FAIL: Invalid command not handled properly (state: {state})")
     return False
 
 def test_5_persistence():
@@ -204,7 +130,7 @@ def test_5_persistence():
     print_section("TEST 5: Job Persistence Across Restarts")
     
     job_id = "test-persist-1"
-    job_json = json.dumps({"id": job_id, "command": "echo 'Persistence Test'"})
+    job_json = job_payload(job_id, "echo 'Persistence Test'")
     
     # Enqueue job
     output, _ = run_cmd(["enqueue", job_json])
@@ -237,7 +163,7 @@ def test_6_all_cli_commands():
     results = []
     
     # Test enqueue
-    job_json = json.dumps({"id": "test-cli-1", "command": "echo test"})
+    job_json = job_payload("test-cli-1", "echo test")
     output, code = run_cmd(["enqueue", job_json], check=False)
     results.append(("enqueue", code == 0))
     
@@ -261,6 +187,10 @@ def test_6_all_cli_commands():
     output, code = run_cmd(["config", "set", "max_retries", "3"], check=False)
     results.append(("config set", code == 0))
     
+    # Test inspect
+    output, code = run_cmd(["inspect", "test-cli-1"], check=False)
+    results.append(("inspect", code == 0 and '"test-cli-1"' in output))
+    
     # Test dlq list
     output, code = run_cmd(["dlq", "list"], check=False)
     results.append(("dlq list", code == 0))
@@ -325,34 +255,22 @@ def test_8_graceful_shutdown():
     
     # Enqueue a long-running job
     job_id = "test-shutdown-1"
-    job_json = json.dumps({"id": job_id, "command": "sleep 3"})
+    job_json = job_payload(job_id, "sleep 3")
     run_cmd(["enqueue", job_json])
     
-    # Start worker
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
+    # Wait for the job to start
+    wait_for_job(job_id, "processing", timeout=10)
     
-    # Wait a bit for job to start
-    time.sleep(1)
-    
-    # Stop workers gracefully
+    # Stop workers gracefully (waits for them to finish their current job)
     output, code = run_cmd(["worker", "stop"], check=False)
     
-    # Wait a bit
-    time.sleep(2)
-    
     # Check if job completed or is still processing
-    output, _ = run_cmd(["list", "--state", "completed"], check=False)
-    if output and job_id in output:
+    if job_in_state(job_id, "completed"):
         print("✅ PASS: Worker finished job before shutdown")
         return True
     else:
         # Check if it's still processing (might have been interrupted)
-        output, _ = run_cmd(["list", "--state", "processing"], check=False)
-        if output and job_id in output:
+        if job_in_state(job_id, "processing"):
             print("⚠️  WARNING: Job still processing (may have been interrupted)")
         else:
             print("✅ PASS: Worker shutdown gracefully")
@@ -362,29 +280,20 @@ def test_9_dlq_retry():
     """Test 9: DLQ retry functionality"""
     print_section("TEST 9: DLQ Retry Functionality")
     
-    # Set max retries to 1 for faster testing
-    run_cmd(["config", "set", "max_retries", "1"])
-    
-    # Enqueue a failing job
+    # The job fails on its first run and succeeds once the marker file
+    # exists, so a retried job can be told apart from the original run.
+    # With no retries allowed the first failure goes straight to the DLQ.
+    _rm(DLQ_MARKER)
     job_id = "test-dlq-retry-1"
-    job_json = json.dumps({"id": job_id, "command": "exit 1"})
+    command = ("python -c \"import os, sys; "
+               f"sys.exit(0 if os.path.exists('{DLQ_MARKER}') "
+               f"else open('{DLQ_MARKER}', 'w').close() or 1)\"")
+    job_json = job_payload(job_id, command, max_retries=0)
     run_cmd(["enqueue", job_json])
     
-    # Start worker to move job to DLQ
-    worker_proc = subprocess.Popen(
-        ["python", "queuectl.py", "worker", "start", "--count", "1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
-    time.sleep(5)
-    
     # Verify in DLQ
-    output, _ = run_cmd(["dlq", "list"], check=False)
-    if not output or job_id not in output:
+    if not wait_for(lambda: in_dlq(job_id), timeout=10):
         print("❌ FAIL: Job not in DLQ")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
     
     print(f"✅ Job {job_id} in DLQ")
@@ -393,25 +302,78 @@ def test_9_dlq_retry():
     output, code = run_cmd(["dlq", "retry", job_id], check=False)
     if code != 0 or "pending" not in output.lower():
         print("❌ FAIL: Could not retry from DLQ")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return False
     
     print(f"✅ Job {job_id} retried from DLQ")
     
-    # Verify job is now pending
-    output, _ = run_cmd(["list", "--state", "pending"], check=False)
-    if output and job_id in output:
+    # The workers are still running, so the job is picked up again at once;
+    # check that the retried run completes
+    passed = wait_for_job(job_id, "completed", timeout=10)
+    _rm(DLQ_MARKER)
+    if passed:
         print(f"✅ PASS: DLQ retry functionality works")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
         return True
     else:
-        print(f"❌ FAIL: Job not in pending state after retry")
-        worker_proc.terminate()
-        worker_proc.wait(timeout=5)
+        print(f"❌ FAIL: Job was not re-run after retry")
         return False
 
+# Tests that must finish before another may start. Configuration Management
+# checks the values it just wrote, and Retry and DLQ rewrites max_retries.
+DEPS = {
+    "Retry and DLQ": {"Configuration Management"},
+}
+
+# Tests that stop the worker pool. They run on their own once nothing else
+# is in flight, and the pool is restarted after each of them.
+EXCLUSIVE = {"All CLI Commands", "Graceful Shutdown"}
+
+def run_tests(tests, restart_pool, fail_fast=False):
+    """Run tests as soon as their DEPS have passed, printing each test's
+    output as it completes; returns results in the order of tests, with
+    None for tests that were skipped"""
+    funcs = dict(tests)
+    sorter = graphlib.TopologicalSorter({name: DEPS.get(name, ()) for name, _ in tests})
+    sorter.prepare()
+    
+    results = {}
+    ready = []    # Ready but not started yet
+    running = {}  # Future -> test name
+    failed = False
+    with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+        while sorter.is_active():
+            ready.extend(sorter.get_ready())
+            
+            # Don't start tests whose prerequisites failed, or anything at
+            # all once a test has failed under --fail-fast
+            for name in list(ready):
+                if (fail_fast and failed) or not all(results.get(dep) for dep in DEPS.get(name, ())):
+                    ready.remove(name)
+                    results[name] = None
+                    print(f"\n⏭️  Skipping '{name}'")
+                    sorter.done(name)
+            
+            for name in [name for name in ready if name not in EXCLUSIVE]:
+                ready.remove(name)
+                running[executor.submit(run_test, name, funcs[name])] = name
+            if not running and ready:
+                # Only pool-stopping tests are left ready; run the next alone
+                name = ready.pop(0)
+                running[executor.submit(run_test, name, funcs[name])] = name
+            if not running:
+                continue  # Only skips this round; their dependents are ready now
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], output = future.result()
+                sys.stdout.write(output)
+                failed = failed or not results[name]
+                if name in EXCLUSIVE:
+                    restart_pool()
+                sorter.done(name)
+    
+    return [(name, results[name]) for name, _ in tests]
+
 def main():
     """Run all validation tests"""
     print("\n" + "=" * 70)
@@ -430,28 +392,34 @@ def main():
         ("DLQ Retry", test_9_dlq_retry),
     ]
     
-    results = []
-    for name, test_func in tests:
-        try:
-            result = test_func()
-            results.append((name, result))
-            time.sleep(1)  # Brief pause between tests
-        except Exception as e:
-            print(f"❌ Test '{name}' crashed: {e}")
-            results.append((name, False))
-        finally:
-            # Stop any running workers
-            run_cmd(["worker", "stop"], check=False)
-            time.sleep(1)
+    # One worker pool serves every test
+    run_cmd(["status"], check=False)  # Create the schema before workers start
+    with contextlib.ExitStack() as pool:
+        pool.enter_context(worker_pool(["--count", "3"]))
+        
+        def restart_pool():
+            # Some tests stop the workers on purpose; bring the pool back.
+            # `worker stop` returns before the pool's parent process has
+            # exited, so go by the workers table rather than poll().
+            output, _ = run_cmd(["status"], check=False)
+            if output and "(none running)" in output:
+                pool.close()  # Reap the stopped pool
+                pool.enter_context(worker_pool(["--count", "3"]))
+        
+        results = run_tests(tests, restart_pool, fail_fast="--fail-fast" in sys.argv)
     
     # Print summary
     print_section("Test Summary")
     
     passed = sum(1 for _, result in results if result)
+    skipped = sum(1 for _, result in results if result is None)
     total = len(results)
     
     for name, result in results:
-        status = "✅ PASS" if result else "❌ FAIL"
+        if result is None:
+            status = "⏭️  SKIP"
+        else:
+            status = "✅ PASS" if result else "❌ FAIL"
         print(f"{status}: {name}")
     
     print("-" * 70)
@@ -461,7 +429,7 @@ def main():
         print("\n🎉 All requirements validated successfully!")
         return 0
     else:
-        print(f"\n⚠️  {total - passed} test(s) failed")
+        print(f"\n⚠️  {total - passed - skipped} test(s) failed, {skipped} skipped")
         return 1
 
 if __name__ == "__main__":